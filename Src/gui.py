@@ -4,13 +4,16 @@ from tkinter import ttk, filedialog, messagebox
 import threading
 import os
 import sys
-from player import ImageScroller # Import the player logic
+from player import ImageScroller, load_imaging_stack, is_imaging_stack_loaded # Import the player logic (cv2/numpy/PIL load lazily)
+from profiling import MemoryProfiler, memory_limit_from_env
 
 
 class GuitarScrollPlayerGUI:
     """
     Manages the Tkinter GUI for the Guitar Scroll Player.
     """
+    STATUS_LOADING_IMAGING = "正在加载图像库..."
+
     def __init__(self, root):
         self.root = root
         self.root.title("吉他谱滚动播放器")
@@ -20,6 +23,8 @@ class GuitarScrollPlayerGUI:
         self.folder_path = tk.StringVar()
         self.speed = tk.DoubleVar(value=2.0) # Changed to DoubleVar for finer control
         self.play_mode = tk.StringVar(value=ImageScroller.MODE_SCROLL) # Default mode
+        self.memory_profile = tk.BooleanVar(value=MemoryProfiler.is_requested()) # Also set by GSP_MEMORY_PROFILE
+        self.memory_limit_bytes = memory_limit_from_env() # Read once so a bad value is only reported once
 
         # Playback control variables
         self.scroll_thread = None
@@ -27,6 +32,7 @@ class GuitarScrollPlayerGUI:
         self.pause_event = threading.Event()
         self.is_paused = False # Track pause state for UI
         self.is_stopping = False
+        self.is_ready = False # True once the widgets are built (False if the app closed itself on startup)
 
         # --- FIXED: Define the relative path to Sheet_Music ---
         # This assumes gui.py is in the same directory as the Sheet_Music folder
@@ -54,6 +60,7 @@ class GuitarScrollPlayerGUI:
 
         self.create_widgets()
         self.populate_folder_list() # Populate the listbox on startup
+        self.is_ready = True
 
     def create_widgets(self):
         # Main Frame
@@ -101,6 +108,9 @@ class GuitarScrollPlayerGUI:
         # Initially disabled until folder is selected
         self.tiled_radio.config(state='disabled')
 
+        self.memory_profile_check = ttk.Checkbutton(mode_frame, text="内存分析 (生成报告)", variable=self.memory_profile)
+        self.memory_profile_check.grid(row=1, column=0, columnspan=2, sticky=tk.W, pady=(5, 0))
+
         # Speed Control
         speed_frame = ttk.LabelFrame(main_frame, text="播放速度", padding="10")
         speed_frame.grid(row=3, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=(0, 10))
@@ -193,6 +203,27 @@ class GuitarScrollPlayerGUI:
             if self.play_mode.get() == ImageScroller.MODE_TILED:
                 self.play_mode.set(ImageScroller.MODE_SCROLL)
 
+    def start_imaging_warmup(self, on_done=None):
+        """
+        Loads cv2/numpy/PIL in a background thread while the user picks a song,
+        so the first playback does not have to wait for them.
+        on_done(elapsed_seconds) is called from the worker thread; elapsed_seconds
+        is None if loading failed.
+        """
+        def warmup():
+            try:
+                elapsed = load_imaging_stack()
+            except Exception as e:
+                print(f"后台加载图像库时出错: {e}")
+                elapsed = None
+            if on_done:
+                on_done(elapsed)
+
+        thread = threading.Thread(target=warmup, name="imaging-warmup")
+        thread.daemon = True
+        thread.start()
+        return thread
+
     def update_speed_label(self, value):
         """Updates the speed label when the scale is moved."""
         self.speed_label.config(text=f"{float(value):.1f}")
@@ -228,16 +259,28 @@ class GuitarScrollPlayerGUI:
         self.stop_button.config(state='disabled')
         self.pause_button.config(state='disabled')
         self.resume_button.config(state='disabled')
-        self.status_var.set(f"正在播放: {os.path.basename(folder)} ({selected_mode})")
+        playing_text = f"正在播放: {os.path.basename(folder)} ({selected_mode})"
+        if is_imaging_stack_loaded():
+            self.status_var.set(playing_text)
+        else:
+            # Playback waits for the background warm-up; say so instead of showing "playing"
+            self.status_var.set(self.STATUS_LOADING_IMAGING)
+            self.root.after(100, self._wait_for_imaging_stack, playing_text)
         self.root.update()
 
 
         def on_playback_finished():
             self.root.after(0, self._reset_ui_state)
 
+        def on_player_message(level, message):
+            # Called from the playback thread; hand over to the Tk thread
+            self.root.after(0, self._show_player_message, level, message, playing_text)
+
 
         # Pass the selected mode to the player, including the callback
-        self.player = ImageScroller(folder, self.speed.get(), selected_mode, self.stop_event, self.pause_event, on_finished_callback=on_playback_finished)
+        self.player = ImageScroller(folder, self.speed.get(), selected_mode, self.stop_event, self.pause_event, on_finished_callback=on_playback_finished,
+                                    memory_profile=self.memory_profile.get(), memory_limit_bytes=self.memory_limit_bytes,
+                                    on_message_callback=on_player_message)
         
         if not self.player.load_images():
             messagebox.showerror("错误", "加载图片列表失败。")
@@ -258,6 +301,23 @@ class GuitarScrollPlayerGUI:
         self.scroll_thread.daemon = True
         self.scroll_thread.start()
 
+    def _wait_for_imaging_stack(self, playing_text):
+        """Polls until the imaging stack is loaded, then replaces the loading status."""
+        if self.status_var.get() != self.STATUS_LOADING_IMAGING:
+            return # Playback already stopped or failed
+        if is_imaging_stack_loaded():
+            self.status_var.set(playing_text)
+        else:
+            self.root.after(100, self._wait_for_imaging_stack, playing_text)
+
+    def _show_player_message(self, level, message, playing_text):
+        """Shows a message reported by the player: errors in a dialog, warnings in the status bar."""
+        if level == "error":
+            self.status_var.set(f"错误: {message}")
+            messagebox.showerror("错误", message)
+        else:
+            self.status_var.set(f"{playing_text} - {message}")
+
     def stop_playback(self):
         """Stops the playback."""
         self.is_stopping = True
@@ -1,8 +1,33 @@
 # main.py
+import time
+_launch_time = time.perf_counter() # Taken first so the startup report covers every import below
+
 import tkinter as tk
+from profiling import StartupProfiler
+
+profiler = StartupProfiler(_launch_time)
+profiler.mark("导入 tkinter")
+
 from gui import GuitarScrollPlayerGUI
+profiler.mark("导入 gui")
+
+FIRST_PAINT_LABEL = "首次绘制"
 
 if __name__ == "__main__":
     root = tk.Tk()
+    profiler.mark("创建 Tk 窗口")
     app = GuitarScrollPlayerGUI(root)
-    root.mainloop()
\ No newline at end of file
+    profiler.mark("构建界面")
+
+    if app.is_ready:
+        # Paint the song list now, before anything heavy is loaded
+        root.update()
+        profiler.mark(FIRST_PAINT_LABEL)
+
+        def on_warmup_done(elapsed):
+            profiler.mark("后台加载图像库" if elapsed is not None else "后台加载图像库 (失败)")
+            profiler.report(FIRST_PAINT_LABEL)
+
+        app.start_imaging_warmup(on_done=on_warmup_done)
+
+    root.mainloop()
@@ -1,11 +1,43 @@
 # player.py
 import os
 import re
-import cv2
-import numpy as np
-from PIL import Image
 import threading
 import time
+from profiling import MemoryProfiler
+
+# --- Lazy imaging stack ---
+# cv2, numpy and PIL are slow to import, so they are bound on first use by
+# load_imaging_stack() instead of at module import. This keeps importing the
+# GUI cheap and lets the launcher warm them up in the background.
+cv2 = None
+np = None
+Image = None
+_imaging_lock = threading.Lock()
+
+
+def load_imaging_stack():
+    """
+    Imports cv2, numpy and PIL if they are not loaded yet. Safe to call from any
+    thread; concurrent callers wait for the first import to finish.
+    Returns the seconds spent importing (0.0 if already loaded).
+    """
+    global cv2, np, Image
+    with _imaging_lock:
+        if cv2 is not None:
+            return 0.0
+        start = time.perf_counter()
+        import numpy as _np
+        from PIL import Image as _Image
+        import cv2 as _cv2
+        np, Image = _np, _Image
+        cv2 = _cv2 # Bound last: a non-None cv2 means the whole stack is ready
+        return time.perf_counter() - start
+
+
+def is_imaging_stack_loaded():
+    """Returns True once load_imaging_stack() has completed."""
+    return cv2 is not None
+# --- END ---
 
 
 class ImageScroller:
@@ -15,13 +47,22 @@ class ImageScroller:
     MODE_SCROLL = "scroll"
     MODE_TILED = "tiled"
 
-    def __init__(self, image_folder_path, speed, mode, stop_event, pause_event, on_finished_callback=None):
+    # Below this load scale a song over its memory limit is refused instead of downscaled
+    MIN_DOWNGRADE_SCALE = 0.5
+
+    def __init__(self, image_folder_path, speed, mode, stop_event, pause_event, on_finished_callback=None,
+                 memory_profile=False, memory_limit_bytes=None, on_message_callback=None):
         self.image_folder_path = image_folder_path
         self.speed = speed
         self.mode = mode
         self.stop_event = stop_event
         self.pause_event = pause_event
         self.on_finished_callback = on_finished_callback
+        self.on_message_callback = on_message_callback # Called from the playback thread with (level, message)
+        self.memory_profile = memory_profile
+        self.memory_limit_bytes = memory_limit_bytes
+        self.memory_profiler = None # Created by run() when memory_profile is on
+        self.load_scale = 1.0 # < 1.0 when the song is downscaled to fit memory_limit_bytes
 
         # --- FIXED: Use folder path as window name ---
         # Note: If the path contains non-ASCII characters that cause issues,
@@ -63,6 +104,104 @@ class ImageScroller:
             print(f"加载图片列表时出错: {e}")
             return False
 
+    def _read_page_sizes(self):
+        """Returns the (width, height) of every page, reading only image headers (nothing is decoded)."""
+        sizes = []
+        for filename in self.image_files_sorted:
+            with Image.open(os.path.join(self.image_folder_path, filename)) as img:
+                sizes.append(img.size)
+        return sizes
+
+    def estimate_memory_bytes(self, scale=1.0, page_sizes=None):
+        """
+        Estimates the peak bytes prepare_scroll_mode/prepare_tiled_mode will hold.
+        Pages are held as 4-byte PIL pixels, the canvas once as PIL (4 bytes per
+        pixel) and twice as NumPy BGR arrays (3 bytes per pixel each). While a
+        page is opened it is briefly held at full size twice (decode plus the
+        RGB convert or resize copy), whatever the scale.
+        """
+        if page_sizes is None:
+            page_sizes = self._read_page_sizes()
+
+        pages_px = 0
+        max_full_px = 0
+        max_width = max_height = total_width = total_height = 0
+        for full_width, full_height in page_sizes:
+            width = max(1, int(full_width * scale))
+            height = max(1, int(full_height * scale))
+            pages_px += width * height
+            max_full_px = max(max_full_px, full_width * full_height)
+            max_width, max_height = max(max_width, width), max(max_height, height)
+            total_width += width
+            total_height += height
+
+        if self.mode == self.MODE_TILED:
+            canvas_px = total_width * max_height
+        else:
+            canvas_px = max_width * total_height
+        return pages_px * 4 + canvas_px * (4 + 3 + 3) + max_full_px * 4 * 2
+
+    def _notify(self, level, message):
+        """Prints a message and forwards it to on_message_callback(level, message), level being 'warning' or 'error'."""
+        print(message)
+        if self.on_message_callback:
+            try:
+                self.on_message_callback(level, message)
+            except Exception as e:
+                print(f"Error in on_message_callback: {e}")
+
+    def _apply_memory_limit(self):
+        """
+        Checks the estimate against memory_limit_bytes before anything is decoded.
+        Downscales the pages if that is enough to fit, otherwise refuses the song.
+        Returns False if the song must not be loaded.
+        """
+        page_sizes = self._read_page_sizes()
+        estimate = self.estimate_memory_bytes(page_sizes=page_sizes)
+        if self.memory_profiler:
+            self.memory_profiler.estimated_bytes = estimate
+        if not self.memory_limit_bytes or estimate <= self.memory_limit_bytes:
+            return True
+
+        # The scaled part grows with the square of the scale; the full-size page term does not
+        fixed = self.estimate_memory_bytes(scale=0.0, page_sizes=page_sizes)
+        scalable = estimate - fixed
+        scale = ((self.memory_limit_bytes - fixed) / scalable) ** 0.5 if self.memory_limit_bytes > fixed else 0.0
+        while scale >= self.MIN_DOWNGRADE_SCALE and self.estimate_memory_bytes(scale, page_sizes) > self.memory_limit_bytes:
+            scale -= 0.01 # Rounding of page sizes can leave the closed-form scale slightly over
+
+        limit_mb = self.memory_limit_bytes / (1024 * 1024)
+        if scale < self.MIN_DOWNGRADE_SCALE:
+            self._notify("error", f"曲谱预计需要 {estimate / (1024 * 1024):.1f} MB 内存，"
+                                  f"超出限制 {limit_mb:.1f} MB，已拒绝加载。")
+            return False
+
+        self.load_scale = scale
+        if self.memory_profiler:
+            self.memory_profiler.estimated_bytes = self.estimate_memory_bytes(scale, page_sizes)
+        self._notify("warning", f"曲谱超出内存限制 {limit_mb:.1f} MB，已按 {scale:.2f} 倍缩小加载。")
+        return True
+
+    def _open_page(self, filename):
+        """Opens one page as an RGB PIL image, scaled by load_scale, and records its size when profiling."""
+        img_path = os.path.join(self.image_folder_path, filename)
+        img = Image.open(img_path)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        if self.load_scale < 1.0:
+            new_size = (max(1, int(img.width * self.load_scale)), max(1, int(img.height * self.load_scale)))
+            img = img.resize(new_size, Image.LANCZOS)
+        if self.memory_profiler:
+            # PIL stores RGB pixels in 4 bytes each
+            self.memory_profiler.record_page(filename, img.width, img.height,
+                                             img.width * img.height * 4, os.path.getsize(img_path))
+        return img
+
+    def _mark_memory(self, stage):
+        """Records a memory checkpoint if memory profiling is on."""
+        if self.memory_profiler:
+            self.memory_profiler.mark(stage)
+
     def prepare_scroll_mode(self):
         """Prepares the combined image for scrolling mode."""
         try:
@@ -74,17 +213,15 @@ class ImageScroller:
             total_height = 0
 
             for filename in self.image_files_sorted:
-                img_path = os.path.join(self.image_folder_path, filename)
                 try:
-                    img = Image.open(img_path)
-                    if img.mode != 'RGB':
-                        img = img.convert('RGB')
+                    img = self._open_page(filename)
                     pil_images.append(img)
                     max_width = max(max_width, img.width)
                     total_height += img.height
                 except Exception as e:
                     print(f"警告: 无法加载图片 {filename}: {e}")
                     return False
+            self._mark_memory("加载图片")
 
             if not pil_images:
                  raise FileNotFoundError("所选文件夹中未找到有效的图片文件")
@@ -96,11 +233,14 @@ class ImageScroller:
                 x_offset = (max_width - img.width) // 2
                 combined_img.paste(img, (x_offset, y_offset))
                 y_offset += img.height
+            self._mark_memory("拼接画布")
 
             self.combined_image = np.array(combined_img)
             self.combined_image = self.combined_image[:, :, ::-1].copy()
             self.img_height, self.img_width = self.combined_image.shape[:2]
+            self._mark_memory("转换为数组")
             self.display_image = self.combined_image.copy()
+            self._mark_memory("显示副本")
             return True
 
         except Exception as e:
@@ -118,16 +258,14 @@ class ImageScroller:
             total_width = 0
 
             for filename in self.image_files_sorted:
-                img_path = os.path.join(self.image_folder_path, filename)
                 try:
-                    img = Image.open(img_path)
-                    if img.mode != 'RGB':
-                        img = img.convert('RGB')
+                    img = self._open_page(filename)
                     pil_images.append(img)
                     max_height = max(max_height, img.height)
                     total_width += img.width
                 except Exception as e:
                     print(f"警告: 无法加载图片 {filename} 用于平铺: {e}")
+            self._mark_memory("加载图片")
 
             if not pil_images:
                  raise FileNotFoundError("所选文件夹中未找到有效的图片文件用于平铺")
@@ -138,9 +276,11 @@ class ImageScroller:
             for img in pil_images:
                 tiled_img.paste(img, (x_offset, 0))
                 x_offset += img.width
+            self._mark_memory("拼接画布")
 
             self.tiled_image = np.array(tiled_img)
             self.tiled_image = self.tiled_image[:, :, ::-1].copy()
+            self._mark_memory("转换为数组")
             return True
 
         except Exception as e:
@@ -150,18 +290,46 @@ class ImageScroller:
 
     def run(self):
         """Public method to start the playback based on the selected mode."""
-        if self.mode == self.MODE_SCROLL:
-            if self.prepare_scroll_mode():
-                self._run_scroll_mode()
+        can_play = True
+        try:
+            # No-op if the launcher already warmed the stack up in the background
+            load_imaging_stack()
+        except Exception as e:
+            self._notify("error", f"无法加载图像库: {e}")
+            can_play = False # Skip playback but still notify the GUI below
+
+        if self.memory_profile:
+            # Started after the imaging stack so its import is not charged to the song
+            song_name = os.path.basename(os.path.normpath(self.image_folder_path))
+            self.memory_profiler = MemoryProfiler(song_name)
+            self.memory_profiler.start()
+
+        # Reading every page header costs a pass over the files, so only do it when the estimate is used
+        if can_play and self.image_files_sorted and (self.memory_limit_bytes or self.memory_profiler):
+            try:
+                can_play = self._apply_memory_limit()
+            except Exception as e:
+                # Unreadable headers are reported again by prepare_*_mode
+                print(f"估算内存占用时出错: {e}")
+
+        if can_play:
+            if self.mode == self.MODE_SCROLL:
+                if self.prepare_scroll_mode():
+                    self._run_scroll_mode()
+                else:
+                    print("无法启动滚动模式。")
+            elif self.mode == self.MODE_TILED:
+                 if self.prepare_tiled_mode():
+                     self._run_tiled_mode()
+                 else:
+                     print("无法启动平铺模式。")
             else:
-                print("无法启动滚动模式。")
-        elif self.mode == self.MODE_TILED:
-             if self.prepare_tiled_mode():
-                 self._run_tiled_mode()
-             else:
-                 print("无法启动平铺模式。")
-        else:
-            print(f"未知的播放模式: {self.mode}")
+                print(f"未知的播放模式: {self.mode}")
+
+        if self.memory_profiler:
+            self._mark_memory("播放结束")
+            self.memory_profiler.stop()
+            self.memory_profiler.write_report()
 
         # --- 新增：在线程结束时调用回调 ---
         if self.on_finished_callback:
@@ -0,0 +1,301 @@
+# profiling.py
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+
+
+class StartupProfiler:
+    """
+    Records named checkpoints during launch and prints a timing report, so the
+    time until the window first paints can be kept under a fixed budget.
+
+    Enabled with the GSP_STARTUP_PROFILE=1 environment variable or the
+    --profile-startup command line flag. The budget (milliseconds) can be set
+    with GSP_STARTUP_BUDGET_MS.
+    """
+    ENV_ENABLE = "GSP_STARTUP_PROFILE"
+    ENV_BUDGET = "GSP_STARTUP_BUDGET_MS"
+    CLI_FLAG = "--profile-startup"
+    DEFAULT_BUDGET_MS = 1000.0
+
+    def __init__(self, start_time=None, enabled=None, budget_ms=None):
+        # start_time should be taken with time.perf_counter() as early as possible in main.py
+        self.start_time = start_time if start_time is not None else time.perf_counter()
+        self.enabled = self.is_requested() if enabled is None else enabled
+        self.budget_ms = budget_ms if budget_ms is not None else self._budget_from_env()
+        self.marks = [] # List of (label, ms since start)
+
+    @classmethod
+    def is_requested(cls):
+        """Checks the environment variable and command line for the profiling switch."""
+        value = os.environ.get(cls.ENV_ENABLE, "").strip().lower()
+        return value in ("1", "true", "yes", "on") or cls.CLI_FLAG in sys.argv[1:]
+
+    def _budget_from_env(self):
+        value = os.environ.get(self.ENV_BUDGET)
+        if not value:
+            return self.DEFAULT_BUDGET_MS
+        try:
+            return float(value)
+        except ValueError:
+            print(f"警告: 无效的 {self.ENV_BUDGET} 值 '{value}'，使用默认值 {self.DEFAULT_BUDGET_MS:.0f} ms")
+            return self.DEFAULT_BUDGET_MS
+
+    def mark(self, label):
+        """Records a checkpoint. Returns the elapsed milliseconds since start."""
+        elapsed_ms = (time.perf_counter() - self.start_time) * 1000.0
+        self.marks.append((label, elapsed_ms))
+        return elapsed_ms
+
+    def elapsed_ms(self, label):
+        """Returns the elapsed milliseconds of the first checkpoint with this label, or None."""
+        for mark_label, elapsed in self.marks:
+            if mark_label == label:
+                return elapsed
+        return None
+
+    def format_report(self, budget_label=None):
+        """
+        Builds the report text: one line per checkpoint with the time spent in
+        that stage and the cumulative time. If budget_label is given, the
+        cumulative time at that checkpoint is compared against the budget.
+        """
+        lines = ["启动耗时报告:"]
+        width = max([len(label) for label, _ in self.marks] + [4])
+        previous = 0.0
+        for label, elapsed in self.marks:
+            lines.append(f"  {label:<{width}}  +{elapsed - previous:8.1f} ms  (累计 {elapsed:8.1f} ms)")
+            previous = elapsed
+
+        if budget_label is not None:
+            measured = self.elapsed_ms(budget_label)
+            if measured is None:
+                lines.append(f"  未记录 '{budget_label}'，无法检查预算")
+            elif measured > self.budget_ms:
+                lines.append(f"  超出预算: '{budget_label}' 用时 {measured:.1f} ms > {self.budget_ms:.0f} ms")
+            else:
+                lines.append(f"  预算内: '{budget_label}' 用时 {measured:.1f} ms <= {self.budget_ms:.0f} ms")
+        return "\n".join(lines)
+
+    def report(self, budget_label=None):
+        """Prints the report if profiling is enabled. Returns True if within budget."""
+        measured = self.elapsed_ms(budget_label) if budget_label is not None else None
+        within_budget = measured is None or measured <= self.budget_ms
+        if self.enabled:
+            print(self.format_report(budget_label))
+        return within_budget
+
+
+# --- Memory profiling ---
+_psutil = None # Optional psutil module (gives RSS on every platform); False once known to be missing
+
+
+def current_rss_bytes():
+    """Returns the resident set size of this process in bytes, or None if it cannot be read."""
+    global _psutil
+    if _psutil is None:
+        # Imported on first use so the optional dependency stays off the startup path
+        try:
+            import psutil as _psutil
+        except ImportError:
+            _psutil = False
+    if _psutil:
+        try:
+            return _psutil.Process().memory_info().rss
+        except Exception:
+            return None
+    try:
+        # Linux fallback when psutil is not installed
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def memory_limit_from_env():
+    """
+    Reads the per-song memory limit (GSP_MEMORY_LIMIT_MB). Returns bytes, or None
+    if unset or invalid (not a finite number greater than 0).
+    """
+    value = os.environ.get(MemoryProfiler.ENV_LIMIT)
+    if not value:
+        return None
+    try:
+        limit_mb = float(value)
+        if not math.isfinite(limit_mb):
+            raise ValueError(value)
+        limit_bytes = int(limit_mb * 1024 * 1024)
+        if limit_bytes <= 0: # Also catches values that round down to 0 bytes
+            raise ValueError(value)
+        return limit_bytes
+    except (ValueError, OverflowError):
+        print(f"警告: 无效的 {MemoryProfiler.ENV_LIMIT} 值 '{value}'，不限制内存")
+        return None
+
+
+class MemoryProfiler:
+    """
+    Records memory use of one song's load/stitch pipeline and playback.
+
+    tracemalloc covers Python and NumPy allocations; RSS sampling in a
+    background thread also covers PIL and OpenCV buffers, which tracemalloc
+    cannot see. Stages are recorded with mark(); each entry holds the traced
+    memory and its peak since the previous mark, plus the RSS at that point.
+
+    Enabled with GSP_MEMORY_PROFILE=1 or the checkbox in the GUI. Reports are
+    written as JSON to GSP_MEMORY_REPORT_DIR (default ./memory_reports).
+    """
+    ENV_ENABLE = "GSP_MEMORY_PROFILE"
+    ENV_REPORT_DIR = "GSP_MEMORY_REPORT_DIR"
+    ENV_LIMIT = "GSP_MEMORY_LIMIT_MB"
+    DEFAULT_REPORT_DIR = "memory_reports"
+    TOP_SITES = 10
+
+    def __init__(self, song_name, sample_interval=0.5):
+        self.song_name = song_name
+        self.sample_interval = sample_interval
+
+        self.stages = [] # List of dicts, one per mark()
+        self.pages = [] # List of dicts, one per loaded image
+        self.rss_samples = [] # List of (seconds since start, rss bytes)
+        self.peak_rss = None
+        self.peak_traced = 0
+        self.top_sites = [] # Largest allocation sites at the highest traced point
+        self._top_sites_traced = -1 # Traced bytes when top_sites was taken
+        self.estimated_bytes = None
+
+        self._start_time = None
+        self._started_tracemalloc = False
+        self._sampler_thread = None
+        self._sampler_stop = threading.Event()
+
+    @classmethod
+    def is_requested(cls):
+        """Checks the environment variable for the memory profiling switch."""
+        value = os.environ.get(cls.ENV_ENABLE, "").strip().lower()
+        return value in ("1", "true", "yes", "on")
+
+    def start(self):
+        """Starts tracemalloc (unless already tracing) and the RSS sampler thread."""
+        self._start_time = time.perf_counter()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._sample_rss()
+        self._sampler_stop.clear()
+        self._sampler_thread = threading.Thread(target=self._sample_loop, name="rss-sampler")
+        self._sampler_thread.daemon = True
+        self._sampler_thread.start()
+
+    def stop(self):
+        """Stops sampling and, if this profiler started it, tracemalloc."""
+        self._sampler_stop.set()
+        if self._sampler_thread is not None:
+            self._sampler_thread.join()
+            self._sampler_thread = None
+        self._sample_rss()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def _sample_loop(self):
+        while not self._sampler_stop.wait(self.sample_interval):
+            self._sample_rss()
+
+    def _sample_rss(self):
+        rss = current_rss_bytes()
+        if rss is None:
+            return None
+        self.rss_samples.append((time.perf_counter() - self._start_time, rss))
+        if self.peak_rss is None or rss > self.peak_rss:
+            self.peak_rss = rss
+        return rss
+
+    def mark(self, label):
+        """Records the memory state at the end of the stage named label."""
+        if not tracemalloc.is_tracing():
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        self.stages.append({
+            "stage": label,
+            "seconds": round(time.perf_counter() - self._start_time, 3),
+            "traced_bytes": current,
+            "traced_peak_bytes": peak,
+            "rss_bytes": self._sample_rss(),
+        })
+        if current > self._top_sites_traced:
+            # Keep the allocation sites from the point where the most memory was held
+            self._top_sites_traced = current
+            snapshot = tracemalloc.take_snapshot()
+            self.top_sites = [
+                {"site": str(stat.traceback), "bytes": stat.size, "count": stat.count}
+                for stat in snapshot.statistics("lineno")[:self.TOP_SITES]
+            ]
+            del snapshot
+        self.peak_traced = max(self.peak_traced, peak)
+        if hasattr(tracemalloc, "reset_peak"): # Python 3.9+: make the peak per-stage
+            # Reset after the snapshot so its own allocations are not charged to the next stage
+            tracemalloc.reset_peak()
+
+    def record_page(self, filename, width, height, decoded_bytes, file_bytes):
+        """Records the size of one loaded page."""
+        self.pages.append({
+            "file": filename,
+            "width": width,
+            "height": height,
+            "decoded_bytes": decoded_bytes,
+            "file_bytes": file_bytes,
+        })
+
+    def to_dict(self):
+        return {
+            "song": self.song_name,
+            "estimated_bytes": self.estimated_bytes,
+            "peak_traced_bytes": self.peak_traced,
+            "peak_rss_bytes": self.peak_rss,
+            "pages": self.pages,
+            "stages": self.stages,
+            "top_allocation_sites": self.top_sites,
+            "rss_samples": [[round(t, 3), rss] for t, rss in self.rss_samples],
+        }
+
+    def format_summary(self):
+        """Builds a short human-readable summary of the report."""
+        def mb(value):
+            return "未知" if value is None else f"{value / (1024 * 1024):.1f} MB"
+
+        lines = [f"内存报告: {self.song_name}"]
+        lines.append(f"  峰值 (tracemalloc): {mb(self.peak_traced)}  峰值 RSS: {mb(self.peak_rss)}  预估: {mb(self.estimated_bytes)}")
+        for page in self.pages:
+            lines.append(f"  页面 {page['file']}: {page['width']}x{page['height']}  解码 {mb(page['decoded_bytes'])}")
+        for stage in self.stages:
+            lines.append(f"  阶段 {stage['stage']}: 当前 {mb(stage['traced_bytes'])}  阶段峰值 {mb(stage['traced_peak_bytes'])}  RSS {mb(stage['rss_bytes'])}")
+        for site in self.top_sites[:3]:
+            lines.append(f"  分配点 {site['site']}: {mb(site['bytes'])}")
+        return "\n".join(lines)
+
+    def write_report(self, report_dir=None):
+        """Writes the report as JSON and prints a summary. Returns the file path, or None on failure."""
+        report_dir = report_dir or os.environ.get(self.ENV_REPORT_DIR) or self.DEFAULT_REPORT_DIR
+        safe_name = re.sub(r'[\\/:*?"<>|\s]+', "_", self.song_name) or "song"
+        base = os.path.join(report_dir, f"{safe_name}_{time.strftime('%Y%m%d_%H%M%S')}")
+        path = f"{base}.json"
+        suffix = 1
+        while os.path.exists(path): # Several playbacks of one song within a second
+            path = f"{base}_{suffix}.json"
+            suffix += 1
+        print(self.format_summary())
+        try:
+            os.makedirs(report_dir, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            print(f"写入内存报告时出错: {e}")
+            return None
+        print(f"内存报告已保存: {path}")
+        return path